@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 import libsonic
 import asyncio
-import time
 from config import settings
+from library_index import library
+from history import history
+from loop_health import run_blocking
 
-async def add_to_playlist(name, songs, manager):
+async def add_to_playlist(name, songs, manager, job=None, scan=True, id_cache=None):
+    # libsonic is blocking, so every call to it runs in the blocking pool
+    loop = asyncio.get_running_loop()
     conn = libsonic.Connection(settings.URL, settings.NAVIDROME_USERNAME, settings.PASSWORD, settings.NAVIDROME_PORT)
-    await manager.broadcast("Scanning Library for new songs")
-    conn.startScan()
-    time.sleep(5)
-    await manager.broadcast("Scan Completed")
-    print("started Scan")
+    if scan:
+        await manager.broadcast("Scanning Library for new songs")
+        await run_blocking(conn.startScan)
+        await asyncio.sleep(5)
+        await manager.broadcast("Scan Completed")
+        print("started Scan")
+    # Titles already looked up in Navidrome, shared between playlists in a bulk import
+    if id_cache is None:
+        id_cache = {}
 
     def get_playlist_id(name):
         print("getting Playlist name")
@@ -36,15 +44,21 @@ async def add_to_playlist(name, songs, manager):
         song_ids = []
         for i in titles:
             print(i)
-            search_item = i.replace(" - "," ")
+            if i in id_cache:
+                song_ids.append(id_cache[i])
+                continue
+            search_item = library.search_term(i)
             print("search_item:", search_item)
             result = conn.search2(query=search_item,artistCount=0,albumCount=0,songCount=1)
             print(result)
             if "song" in result["searchResult2"]:
                 song_ids.append(result["searchResult2"]["song"][0]["id"])
+                id_cache[i] = result["searchResult2"]["song"][0]["id"]
+                if job is not None:
+                    loop.call_soon_threadsafe(history.record_match, job, i, result["searchResult2"]["song"][0]["id"])
             else:
                 msg = str(i+" not found in navidrome")
-                asyncio.create_task(manager.broadcast(msg))
+                asyncio.run_coroutine_threadsafe(manager.broadcast(msg), loop)
 
         return song_ids
 
@@ -68,4 +82,4 @@ async def add_to_playlist(name, songs, manager):
             conn.updatePlaylist(lid=play_id,songIdsToAdd=ids)
 
     print("running base function")
-    add_songs_to_playlist(songs,name)
+    await run_blocking(add_songs_to_playlist, songs, name)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+from rate_governor import governor
+
+def parse_import(text: str) -> list:
+    """Read url -> navidrome playlist pairs from JSON or CSV
+
+    JSON can be a list of {"url": ..., "playlist": ...} objects or a {url: playlist} object.
+    CSV has url,playlist rows with an optional header.
+    """
+    text = text.strip()
+    pairs = []
+    if text.startswith("[") or text.startswith("{"):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            pairs = list(data.items())
+        else:
+            pairs = [(item["url"], item.get("playlist", "")) for item in data]
+    else:
+        for row in csv.reader(io.StringIO(text)):
+            if not row or row[0].strip().lower() == "url":
+                continue
+            pairs.append((row[0], row[1] if len(row) > 1 else ""))
+    for url, playlist in pairs:
+        if not isinstance(url, str) or not isinstance(playlist, str):
+            raise ValueError(f"url and playlist must be strings, got {url!r}: {playlist!r}")
+    # The same url -> playlist pair listed twice is only imported once
+    pairs = list(dict.fromkeys((url.strip(), playlist.strip()) for url, playlist in pairs if url.strip()))
+    if not pairs:
+        raise ValueError("No playlists found in import file")
+    return pairs
+
+def display_name(song: dict) -> str:
+    """The name spotdl uses for a song in its Downloaded/Skipping output, which only has the main artist"""
+    artist = song.get("artist") or song["artists"][0]
+    return artist + " - " + song["name"]
+
+def song_key(song: dict) -> str:
+    return song.get("song_id") or song.get("url") or display_name(song)
+
+async def resolve_playlist(url: str, workdir: str) -> list:
+    """Fetch a playlist's track metadata with spotdl save, without downloading anything"""
+    save_file = os.path.join(workdir, hashlib.sha1(url.encode()).hexdigest() + ".spotdl")
+    await governor.acquire()
+    process = await asyncio.create_subprocess_exec(
+        'spotdl', 'save', url, '--save-file', save_file,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT
+    )
+    output, _ = await process.communicate()
+    if not os.path.exists(save_file):
+        raise RuntimeError(f"Could not resolve {url}: {output.decode('utf-8', errors='ignore').strip()[-200:]}")
+    return await asyncio.to_thread(read_save_file, save_file)
+
+def read_save_file(path: str) -> list:
+    with open(path) as f:
+        return json.load(f)
+
+class TrackPlan:
+    """Unique tracks across every playlist in an import, and which playlists want each one"""
+
+    def __init__(self):
+        self.songs = {}
+        self.playlists = {}
+
+    def add(self, playlist: str, songs: list):
+        keys = self.playlists.setdefault(playlist, [])
+        for song in songs:
+            key = song_key(song)
+            self.songs.setdefault(key, song)
+            if key not in keys:
+                keys.append(key)
+
+    def remove(self, playlist: str):
+        """Drop a playlist, and any track no other playlist wants"""
+        keys = self.playlists.pop(playlist, [])
+        wanted = {key for others in self.playlists.values() for key in others}
+        for key in keys:
+            if key not in wanted:
+                self.songs.pop(key, None)
+
+    def shards(self, workdir: str, size: int) -> list:
+        """Write the unique tracks out as .spotdl files of at most size tracks each
+
+        Returns (path, track names) pairs, so each shard can be sized from what's already on disk.
+        """
+        songs = list(self.songs.values())
+        shards = []
+        for index in range(0, len(songs), size):
+            path = os.path.join(workdir, f"shard-{index // size}.spotdl")
+            with open(path, "w") as f:
+                json.dump(songs[index:index + size], f)
+            shards.append((path, [display_name(song) for song in songs[index:index + size]]))
+        return shards
+
+    def titles_for(self, playlist: str, available: set) -> list:
+        """Names of a playlist's tracks that ended up in the library"""
+        titles = [display_name(self.songs[key]) for key in self.playlists[playlist]]
+        return [title for title in titles if title in available]
+
+def make_workdir() -> str:
+    return tempfile.mkdtemp(prefix="spotdl-import-")
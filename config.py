@@ -1,11 +1,195 @@
+import asyncio
+import json
 import os
+import re
+import threading
+
+# Spellings accepted for bool settings, as commonly used in environment variables
+TRUE_VALUES = ("true", "1", "yes", "on")
+FALSE_VALUES = ("false", "0", "no", "off")
+
+class Field:
+    def __init__(self, type, default, comment="", minimum=None, choices=None, pattern=None, restart=False, secret=False):
+        self.type = type
+        self.default = default
+        self.comment = comment
+        self.minimum = minimum
+        self.choices = choices
+        self.pattern = pattern
+        # Read once at startup, changing it at runtime has no effect until restart
+        self.restart = restart
+        # Hidden from the admin endpoint
+        self.secret = secret
+
+    def parse(self, name: str, raw):
+        """Convert a raw value from the environment, config file or admin endpoint, raising ValueError if invalid"""
+        if self.type is bool:
+            if isinstance(raw, str):
+                if raw.strip().lower() not in TRUE_VALUES + FALSE_VALUES:
+                    raise ValueError(f"{name} must be true or false")
+                value = raw.strip().lower() in TRUE_VALUES
+            else:
+                value = bool(raw)
+        else:
+            if isinstance(raw, bool) and self.type is not str:
+                raise ValueError(f"{name} must be a {self.type.__name__}")
+            # int() would silently truncate 2.9 to 2
+            if self.type is int and isinstance(raw, float) and not raw.is_integer():
+                raise ValueError(f"{name} must be a whole number")
+            try:
+                value = self.type(raw)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be a {self.type.__name__}")
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError(f"{name} must be at least {self.minimum}")
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(f"{name} must be one of {', '.join(self.choices)}")
+        if self.pattern is not None and not re.fullmatch(self.pattern, value):
+            raise ValueError(f"{name} is not in the expected format")
+        return value
+
+FIELDS = {
+    "URL": Field(str, "default"),
+    "NAVIDROME_USERNAME": Field(str, "default"),
+    "PASSWORD": Field(str, "passwords", secret=True),
+    "NAVIDROME_PORT": Field(str, "8000"),
+    "PIN": Field(str, "1234", "Default PIN, should be changed via environment variable", secret=True),
+    "SESSION_SECRET": Field(str, "your-secret-key-change-this", secret=True),
+
+    # Download directory and disk space admission control
+    "DOWNLOAD_DIR": Field(str, "./downloads", restart=True),
+    "BITRATE": Field(str, "320k", pattern=r"\d+[kK]"),
+    "AVG_TRACK_SECONDS": Field(int, 240, "Used to estimate a job's size", minimum=1),
+    "MIN_FREE_MB": Field(int, 500, "Space always left free on the volume", minimum=0),
+    "PLAYLIST_QUOTA_MB": Field(int, 0, "0 disables per-playlist quotas", minimum=0),
+    "DEFER_INTERVAL": Field(int, 60, "Seconds between retries of a deferred job", minimum=1),
+    "MAX_DEFERRALS": Field(int, 30, "Retries before a deferred job fails", minimum=0),
+    "SWEEP_INTERVAL": Field(int, 600, "Seconds between partial file sweeps", minimum=1),
+    "PARTIAL_MAX_AGE": Field(int, 3600, "Age before a partial file is removed", minimum=0),
+
+    # Content hash deduplication of the downloads library
+    "DEDUP_MODE": Field(str, "hardlink", choices=("hardlink", "reject", "off")),
+    "INDEX_INTERVAL": Field(int, 900, "Seconds between full library scans", minimum=1),
+
+    # Upstream rate governor shared by all spotdl launches
+    "GOVERNOR_RATE": Field(float, 0.2, "spotdl launches per second", minimum=0.001),
+    "GOVERNOR_BURST": Field(int, 3, "Launches allowed back to back", minimum=1),
+    "SPOTDL_THREADS": Field(int, 4, "spotdl --threads at full rate", minimum=1),
+    "GOVERNOR_COOLDOWN": Field(int, 30, "First pause after a rate limit", minimum=1),
+    "GOVERNOR_MAX_COOLDOWN": Field(int, 600, "Longest pause", minimum=1),
+
+    # Job history database
+    "HISTORY_DB": Field(str, "", "Defaults to .history.db in DOWNLOAD_DIR", restart=True),
+    "HISTORY_BATCH_SIZE": Field(int, 50, "Pending writes before a flush", minimum=1),
+    "HISTORY_FLUSH_INTERVAL": Field(int, 5, "Seconds between flushes", minimum=1),
+
+    # Bulk playlist import
+    "BULK_SHARD_SIZE": Field(int, 200, "Unique tracks per spotdl run in a bulk import", minimum=1),
+
+    # Progress reporting
+    "PROGRESS_JOBS_KEPT": Field(int, 20, "Finished jobs kept for the summary view", minimum=0),
+
+    # Event loop health
+    "BLOCKING_WORKERS": Field(int, 4, "Threads for blocking client calls", minimum=1, restart=True),
+    "LOOP_MONITOR_INTERVAL": Field(float, 0.1, "Seconds between lag samples", minimum=0.01),
+    "LOOP_BLOCK_THRESHOLD": Field(float, 0.25, "Stall in seconds that logs a stack trace", minimum=0.01),
+    "LOOP_DEBUG": Field(bool, False, "Enable asyncio debug mode", restart=True),
+    "SLOW_CALLBACK": Field(float, 0.05, "Callbacks slower than this are logged in debug mode", minimum=0.001),
+
+    # WebSocket streaming
+    "WS_FLUSH_INTERVAL": Field(float, 0.5, "Seconds between batched frames to compact clients", minimum=0.01),
+    "WS_DEFLATE": Field(bool, True, "Allow permessage-deflate negotiation", restart=True),
+}
 
 class Settings:
-    URL = os.getenv("URL", "default")
-    NAVIDROME_USERNAME = os.getenv("NAVIDROME_USERNAME", "default")
-    PASSWORD = os.getenv("PASSWORD", "passwords")
-    NAVIDROME_PORT = os.getenv("NAVIDROME_PORT", "8000")
-    PIN = os.getenv("PIN", "1234")  # Default PIN, should be changed via environment variable
-    SESSION_SECRET = os.getenv("SESSION_SECRET", "your-secret-key-change-this")
+    """Validated settings from the environment and an optional JSON file, reloadable at runtime"""
+
+    def __init__(self):
+        self.CONFIG_FILE = os.getenv("CONFIG_FILE", "")
+        self.lock = threading.Lock()
+        # Values set through the admin endpoint, kept across file reloads
+        self.overrides = {}
+        self.file_mtime = self.config_mtime()
+        self.apply(self.resolve())
+
+    def config_mtime(self):
+        try:
+            return os.path.getmtime(self.CONFIG_FILE) if self.CONFIG_FILE else None
+        except OSError:
+            return None
+
+    def read_file(self) -> dict:
+        if not self.CONFIG_FILE or not os.path.exists(self.CONFIG_FILE):
+            return {}
+        with open(self.CONFIG_FILE) as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{self.CONFIG_FILE} must contain a JSON object")
+        return data
+
+    def resolve(self, overrides: dict = None) -> dict:
+        """Build and validate a full set of values: defaults < environment < config file < overrides"""
+        raw = {name: os.getenv(name, field.default) for name, field in FIELDS.items()}
+        raw.update(self.read_file())
+        raw.update(self.overrides if overrides is None else overrides)
+        unknown = set(raw) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        values = {name: FIELDS[name].parse(name, raw[name]) for name in FIELDS}
+        if values["GOVERNOR_COOLDOWN"] > values["GOVERNOR_MAX_COOLDOWN"]:
+            raise ValueError("GOVERNOR_COOLDOWN must not be more than GOVERNOR_MAX_COOLDOWN")
+        if not values["HISTORY_DB"]:
+            values["HISTORY_DB"] = os.path.join(values["DOWNLOAD_DIR"], ".history.db")
+        return values
+
+    def apply(self, values: dict) -> list:
+        """Swap in a validated set of values, returning the names that changed"""
+        changed = []
+        with self.lock:
+            for name, value in values.items():
+                if hasattr(self, name) and getattr(self, name) == value:
+                    continue
+                if hasattr(self, name) and FIELDS[name].restart:
+                    print(f"⚠️  {name} changed but only takes effect after a restart")
+                    continue
+                changed.append(name)
+                setattr(self, name, value)
+        return changed
+
+    def reload(self) -> list:
+        """Re-read the environment and config file, keeping the old values if anything is invalid"""
+        return self.apply(self.resolve())
+
+    def update(self, values: dict) -> list:
+        """Apply admin overrides, validating them together with everything else first"""
+        overrides = dict(self.overrides, **values)
+        resolved = self.resolve(overrides)
+        self.overrides = overrides
+        return self.apply(resolved)
+
+    async def watch(self, interval: float = 5):
+        """Reload whenever the config file changes"""
+        while True:
+            await asyncio.sleep(interval)
+            mtime = self.config_mtime()
+            if mtime == self.file_mtime:
+                continue
+            self.file_mtime = mtime
+            try:
+                changed = self.reload()
+                if changed:
+                    print(f"🔄 Reloaded settings from {self.CONFIG_FILE}: {', '.join(changed)}")
+            except (OSError, ValueError) as e:
+                print(f"❌ Invalid settings in {self.CONFIG_FILE}, keeping current values: {e}")
+
+    def public(self) -> dict:
+        return {
+            name: {
+                "value": "***" if field.secret else getattr(self, name),
+                "description": field.comment,
+                "restart": field.restart,
+            }
+            for name, field in FIELDS.items()
+        }
 
 settings = Settings()
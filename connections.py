@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import msgpack
+from config import settings
+
+# Opt-in compact protocols for /ws, negotiated with ?protocol=...
+# "text" is the original one frame per message protocol
+COMPACT_PROTOCOLS = ("batch", "msgpack")
+
+class ConnectionManager:
+    def __init__(self):
+        self.active_connections: list = []
+        self.protocols: dict = {}
+        # Buffered for compact clients until the next flush
+        self.pending_logs: list[str] = []
+        self.pending_messages: list[dict] = []
+        self.pending_progress = None
+
+    async def connect(self, websocket, protocol: str = "text"):
+        await websocket.accept()
+        protocol = protocol if protocol in COMPACT_PROTOCOLS else "text"
+        if protocol != "text":
+            # A new client is sent the current state on connect, so hand what's buffered
+            # to the existing clients first instead of sending it the same progress twice
+            await self.flush()
+        self.active_connections.append(websocket)
+        self.protocols[websocket] = protocol
+
+    def disconnect(self, websocket):
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+        self.protocols.pop(websocket, None)
+
+    def has_compact_clients(self) -> bool:
+        return any(protocol != "text" for protocol in self.protocols.values())
+
+    async def send_frame(self, websocket, frame: dict):
+        """Send one batch frame to a compact client"""
+        if self.protocols.get(websocket) == "msgpack":
+            await websocket.send_bytes(msgpack.packb(frame))
+        else:
+            await websocket.send_text(json.dumps(frame))
+
+    async def send(self, websocket, logs: list[str] = (), messages: list[dict] = ()):
+        """Send logs and JSON messages to one client in its own protocol"""
+        if self.protocols.get(websocket, "text") == "text":
+            for log in logs:
+                await websocket.send_text(log)
+            for message in messages:
+                await websocket.send_json(message)
+        else:
+            await self.send_frame(websocket, {"type": "batch", "logs": list(logs), "messages": list(messages)})
+
+    async def broadcast(self, message: str):
+        if not self.active_connections:
+            return
+        if self.has_compact_clients():
+            self.pending_logs.append(message)
+        for connection in list(self.active_connections):
+            if self.protocols.get(connection) != "text":
+                continue
+            try:
+                await connection.send_text(message)
+            except Exception as e:
+                print(f"Error broadcasting message: {e}")
+                # Remove broken connections
+                self.disconnect(connection)
+
+    async def broadcast_json(self, data: dict):
+        if not self.active_connections:
+            return
+        if self.has_compact_clients():
+            # Only the latest progress update matters to a batched client
+            if data.get("type") == "progress":
+                self.pending_progress = data
+            else:
+                self.pending_messages.append(data)
+        for connection in list(self.active_connections):
+            if self.protocols.get(connection) != "text":
+                continue
+            try:
+                await connection.send_json(data)
+            except Exception as e:
+                print(f"Error broadcasting JSON: {e}")
+                # Remove broken connections
+                self.disconnect(connection)
+
+    async def flush(self):
+        """Send everything buffered since the last flush as one frame per compact client"""
+        if not (self.pending_logs or self.pending_messages or self.pending_progress):
+            return
+        messages = self.pending_messages
+        if self.pending_progress:
+            messages.append(self.pending_progress)
+        frame = {"type": "batch", "logs": self.pending_logs, "messages": messages}
+        self.pending_logs, self.pending_messages, self.pending_progress = [], [], None
+        for connection in list(self.active_connections):
+            if self.protocols.get(connection) == "text":
+                continue
+            try:
+                await self.send_frame(connection, frame)
+            except Exception as e:
+                print(f"Error flushing batch: {e}")
+                self.disconnect(connection)
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.WS_FLUSH_INTERVAL)
+            await self.flush()
+
+manager = ConnectionManager()
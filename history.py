@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    playlist TEXT,
+    status TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    total INTEGER DEFAULT 0,
+    downloaded INTEGER DEFAULT 0,
+    skipped INTEGER DEFAULT 0,
+    failed INTEGER DEFAULT 0,
+    phases TEXT
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    title TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    -- Gap since the job's previous track finished, spotdl doesn't report per-track durations
+    seconds REAL,
+    navidrome_id TEXT,
+    recorded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_started ON jobs(started);
+CREATE INDEX IF NOT EXISTS tracks_job ON tracks(job_id, outcome);
+CREATE INDEX IF NOT EXISTS tracks_outcome ON tracks(outcome, seconds);
+CREATE INDEX IF NOT EXISTS tracks_title ON tracks(title);
+"""
+
+TRACK_SORTS = {
+    "recent": "recorded DESC",
+    "slowest": "seconds DESC",
+}
+
+class HistoryStore:
+    """Job and per-track outcomes in SQLite, with writes batched off the hot path"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self.db_lock = threading.Lock()
+        self.pending = []
+        # Batches are written in order, so a match's UPDATE never runs before its track's INSERT
+        self.flush_lock = asyncio.Lock()
+        # progress job id -> jobs.id
+        self.job_ids = {}
+
+    def execute(self, sql: str, params=()):
+        with self.db_lock:
+            with self.conn:
+                return self.conn.execute(sql, params)
+
+    def write_batch(self, batch: list):
+        with self.db_lock:
+            with self.conn:
+                for sql, params in batch:
+                    self.conn.execute(sql, params)
+
+    async def flush(self):
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, []
+            try:
+                await asyncio.to_thread(self.write_batch, batch)
+            except sqlite3.Error as e:
+                print(f"Error writing job history: {e}")
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.HISTORY_FLUSH_INTERVAL)
+            await self.flush()
+
+    def queue(self, sql: str, params):
+        self.pending.append((sql, params))
+        if len(self.pending) >= settings.HISTORY_BATCH_SIZE:
+            asyncio.create_task(self.flush())
+
+    async def start_job(self, job, playlist: str):
+        cursor = await asyncio.to_thread(
+            self.execute,
+            "INSERT INTO jobs (url, playlist, status, started) VALUES (?, ?, 'running', ?)",
+            (job.url, playlist, time.time()),
+        )
+        self.job_ids[job.job_id] = cursor.lastrowid
+
+    def record_track(self, job, title: str, outcome: str, seconds: float):
+        job_id = self.job_ids.get(job.job_id)
+        if job_id is None:
+            return
+        self.queue(
+            "INSERT INTO tracks (job_id, title, outcome, seconds, recorded) VALUES (?, ?, ?, ?, ?)",
+            (job_id, title, outcome, seconds, time.time()),
+        )
+
+    def record_match(self, job, title: str, navidrome_id: str):
+        job_id = self.job_ids.get(job.job_id)
+        if job_id is None:
+            return
+        self.queue(
+            "UPDATE tracks SET navidrome_id = ? WHERE job_id = ? AND title = ?",
+            (navidrome_id, job_id, title),
+        )
+
+    async def finish_job(self, job, status: str):
+        job_id = self.job_ids.pop(job.job_id, None)
+        if job_id is None:
+            return
+        progress = job.to_dict()
+        self.queue(
+            "UPDATE jobs SET status = ?, finished = ?, total = ?, downloaded = ?, skipped = ?, failed = ?, phases = ? WHERE id = ?",
+            (status, time.time(), progress["total"], progress["current"], progress["skipped"],
+             progress["failed"], json.dumps(progress["phases"]), job_id),
+        )
+        await self.flush()
+
+    def query(self, sql: str, params=()) -> list:
+        with self.db_lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    async def list_jobs(self, page: int, page_size: int, status: str = "") -> list:
+        where = "WHERE status = ?" if status else ""
+        params = ([status] if status else []) + [page_size, (page - 1) * page_size]
+        return await asyncio.to_thread(
+            self.query, f"SELECT * FROM jobs {where} ORDER BY started DESC LIMIT ? OFFSET ?", params
+        )
+
+    async def list_tracks(self, page: int, page_size: int, job_id: int = 0, outcome: str = "", sort: str = "recent") -> list:
+        clauses = []
+        params = []
+        if job_id:
+            clauses.append("job_id = ?")
+            params.append(job_id)
+        if outcome:
+            clauses.append("outcome = ?")
+            params.append(outcome)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        order = TRACK_SORTS.get(sort, TRACK_SORTS["recent"])
+        params += [page_size, (page - 1) * page_size]
+        return await asyncio.to_thread(
+            self.query, f"SELECT * FROM tracks {where} ORDER BY {order} LIMIT ? OFFSET ?", params
+        )
+
+history = HistoryStore(settings.HISTORY_DB)
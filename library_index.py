@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from mutagen.easyid3 import EasyID3
+from config import settings
+from storage import INDEX_TEMP_SUFFIX
+
+INDEX_FILE = ".library_index.json"
+
+def audio_hash(path: str) -> str:
+    """Hash the audio frames of an MP3, ignoring ID3v2 and ID3v1 tags"""
+    with open(path, "rb") as f:
+        data = f.read()
+    start = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        # ID3v2 size is a 28 bit synchsafe integer
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        start = 10 + size
+    end = len(data)
+    if end - 128 >= start and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    return hashlib.sha1(data[start:end]).hexdigest()
+
+def read_tags(path: str) -> dict:
+    try:
+        tags = EasyID3(path)
+    except Exception:
+        return {}
+    return {key: tags.get(key, [""])[0] for key in ("artist", "title", "album")}
+
+def metadata_key(tags: dict) -> str:
+    if not tags.get("artist") or not tags.get("title"):
+        return ""
+    return "|".join(tags.get(key, "").strip().lower() for key in ("artist", "title", "album"))
+
+class LibraryIndex:
+    def __init__(self, root: str):
+        self.root = root
+        self.lock = threading.Lock()
+        # index_loop and finished jobs both scan, one at a time
+        self.scan_lock = threading.Lock()
+        # file name -> {"hash", "size", "mtime", "tags"}
+        self.files = {}
+        # content hash / metadata key -> canonical file name
+        self.by_hash = {}
+        self.by_meta = {}
+        self.duplicates = 0
+        os.makedirs(self.root, exist_ok=True)
+        self.load()
+
+    def load(self):
+        try:
+            with open(os.path.join(self.root, INDEX_FILE)) as f:
+                self.files = json.load(f)
+        except (OSError, ValueError):
+            self.files = {}
+        self.rebuild_maps()
+
+    def rebuild_maps(self):
+        self.by_hash = {}
+        self.by_meta = {}
+        for name, entry in self.files.items():
+            if entry.get("alias"):
+                continue
+            self.by_hash.setdefault(entry["hash"], name)
+            key = metadata_key(entry["tags"])
+            if key:
+                self.by_meta.setdefault(key, name)
+
+    def prune(self, present: set):
+        """Forget files that have been deleted, and rejected aliases of them"""
+        with self.lock:
+            gone = [name for name, entry in self.files.items() if not entry.get("alias") and name not in present]
+            for name in gone:
+                del self.files[name]
+            for name, entry in list(self.files.items()):
+                if entry.get("alias") and entry["alias"] not in self.files:
+                    del self.files[name]
+                    gone.append(name)
+                    # A dangling symlink would stop spotdl from downloading the track again
+                    path = os.path.join(self.root, name)
+                    if os.path.islink(path):
+                        os.remove(path)
+            if gone:
+                self.rebuild_maps()
+
+    def save(self):
+        with self.lock:
+            files = dict(self.files)
+        try:
+            with open(os.path.join(self.root, INDEX_FILE), "w") as f:
+                json.dump(files, f)
+        except OSError as e:
+            print(f"Error saving library index: {e}")
+
+    def canonical_for(self, name: str, file_hash: str, tags: dict) -> str:
+        canonical = self.by_hash.get(file_hash)
+        if canonical is None:
+            canonical = self.by_meta.get(metadata_key(tags))
+        if canonical is None or canonical == name or canonical not in self.files:
+            return ""
+        return canonical
+
+    def resolve_duplicate(self, name: str, canonical: str):
+        path = os.path.join(self.root, name)
+        canonical_path = os.path.join(self.root, canonical)
+        if os.path.samefile(path, canonical_path):
+            return
+        if settings.DEDUP_MODE == "hardlink":
+            tmp_path = path + INDEX_TEMP_SUFFIX
+            os.link(canonical_path, tmp_path)
+            os.replace(tmp_path, path)
+            print(f"🔗 Hardlinked duplicate {name} -> {canonical}")
+        elif settings.DEDUP_MODE == "reject":
+            # Leave a symlink so spotdl still sees the file and doesn't download it again next sync
+            tmp_path = path + INDEX_TEMP_SUFFIX
+            os.symlink(canonical, tmp_path)
+            os.replace(tmp_path, path)
+            print(f"🗑️ Rejected duplicate {name} (already have {canonical})")
+        self.duplicates += 1
+
+    def index_file(self, name: str):
+        """Fingerprint one file and deduplicate it against the index"""
+        path = os.path.join(self.root, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        entry = self.files.get(name)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return
+
+        file_hash = audio_hash(path)
+        tags = read_tags(path)
+        with self.lock:
+            canonical = self.canonical_for(name, file_hash, tags)
+            if canonical and settings.DEDUP_MODE != "off":
+                self.resolve_duplicate(name, canonical)
+                if settings.DEDUP_MODE == "reject":
+                    # Rejected files are still resolvable by name to their canonical copy
+                    self.files[name] = dict(self.files[canonical], alias=canonical)
+                    return
+                # A metadata match may have replaced different audio, the name now holds the canonical copy
+                file_hash = self.files[canonical]["hash"]
+                tags = self.files[canonical]["tags"]
+                stat = os.stat(path)
+            self.files[name] = {"hash": file_hash, "size": stat.st_size, "mtime": stat.st_mtime, "tags": tags}
+            self.by_hash.setdefault(file_hash, name)
+            key = metadata_key(tags)
+            if key:
+                self.by_meta.setdefault(key, name)
+
+    def scan(self):
+        with self.scan_lock:
+            names = sorted(name for name in os.listdir(self.root) if name.endswith(".mp3"))
+            self.prune(set(names))
+            for name in names:
+                try:
+                    self.index_file(name)
+                except OSError as e:
+                    print(f"Error indexing {name}: {e}")
+            self.save()
+
+    async def index_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.scan)
+            except Exception as e:
+                print(f"Error scanning library: {e}")
+            await asyncio.sleep(settings.INDEX_INTERVAL)
+
+    def lookup(self, title: str) -> dict:
+        """Map a spotdl track title to the tags of its canonical file"""
+        with self.lock:
+            entry = self.files.get(title + ".mp3")
+            if entry is None:
+                return {}
+            canonical = entry.get("alias") or self.by_hash.get(entry["hash"], title + ".mp3")
+            return self.files.get(canonical, entry)["tags"]
+
+    def search_term(self, title: str) -> str:
+        """Navidrome search string for a track, preferring its canonical file's tags"""
+        tags = self.lookup(title)
+        if tags.get("artist") and tags.get("title"):
+            return tags["artist"] + " " + tags["title"]
+        return title.replace(" - ", " ")
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "files": len(self.files),
+                "unique_recordings": len(self.by_hash),
+                "duplicates_resolved": self.duplicates,
+                "dedup_mode": settings.DEDUP_MODE,
+            }
+
+library = LibraryIndex(settings.DOWNLOAD_DIR)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import settings
+
+# Lag samples kept for the percentile report
+LAG_SAMPLES = 1000
+
+# Bounded pool for blocking client calls (libsonic etc.) so they never run on the event loop
+blocking_pool = ThreadPoolExecutor(max_workers=settings.BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_pool, lambda: func(*args, **kwargs))
+
+def percentile(samples: list, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class LoopMonitor:
+    """Measures event loop lag and logs the loop's stack when it's blocked"""
+
+    def __init__(self):
+        self.samples = deque(maxlen=LAG_SAMPLES)
+        self.heartbeat = time.monotonic()
+        self.loop_thread = None
+        self.blocked_reports = 0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        if settings.LOOP_DEBUG:
+            loop.set_debug(True)
+        self.loop_thread = threading.get_ident()
+        threading.Thread(target=self.watchdog, daemon=True, name="loop-watchdog").start()
+
+        while True:
+            # Re-read every tick so runtime config changes apply
+            interval = settings.LOOP_MONITOR_INTERVAL
+            # asyncio logs every callback that holds the loop longer than this in debug mode
+            loop.slow_callback_duration = settings.SLOW_CALLBACK
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            self.heartbeat = time.monotonic()
+            self.samples.append(max(0.0, self.heartbeat - start - interval))
+
+    def watchdog(self):
+        reported = False
+        while True:
+            interval = settings.LOOP_MONITOR_INTERVAL
+            time.sleep(interval)
+            blocked = time.monotonic() - self.heartbeat - interval
+            if blocked < settings.LOOP_BLOCK_THRESHOLD:
+                reported = False
+                continue
+            if reported:
+                continue
+            # Only report once per stall
+            reported = True
+            self.blocked_reports += 1
+            frame = sys._current_frames().get(self.loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "unavailable"
+            print(f"🐢 Event loop blocked for {blocked * 1000:.0f} ms:\n{stack}")
+
+    def status(self) -> dict:
+        samples = list(self.samples)
+        return {
+            "lag_p50_ms": round(percentile(samples, 0.5) * 1000, 2),
+            "lag_p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            "lag_max_ms": round(max(samples, default=0.0) * 1000, 2),
+            "blocked_reports": self.blocked_reports,
+            "debug": settings.LOOP_DEBUG,
+        }
+
+monitor = LoopMonitor()
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Form
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Form, File, UploadFile
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,8 +6,18 @@ from fastapi.staticfiles import StaticFiles
 from spotdl_runner import run_spotdl
 from add_to_playlist import add_to_playlist
 from config import settings
+from storage import storage, JobDeferred, QuotaExceeded
+from library_index import library
+from progress import tracker
+from rate_governor import governor, RateLimited
+from history import history
+from loop_health import monitor
+from bulk_import import parse_import, resolve_playlist, TrackPlan, make_workdir
+from connections import manager
 import asyncio
 import hashlib
+import json
+import shutil
 import secrets
 from typing import Dict
 
@@ -53,43 +63,6 @@ def is_authenticated(request: Request) -> bool:
     print("✅ Session is valid and authenticated")
     return True
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        if not self.active_connections:
-            return
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                print(f"Error broadcasting message: {e}")
-                # Remove broken connections
-                if connection in self.active_connections:
-                    self.active_connections.remove(connection)
-
-    async def broadcast_json(self, data: dict):
-        if not self.active_connections:
-            return
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(data)
-            except Exception as e:
-                print(f"Error broadcasting JSON: {e}")
-                # Remove broken connections
-                if connection in self.active_connections:
-                    self.active_connections.remove(connection)
-
-manager = ConnectionManager()
 
 class State:
     def __init__(self):
@@ -104,6 +77,19 @@ class State:
 
 state = State()
 
+@app.on_event("startup")
+async def start_background_tasks():
+    asyncio.create_task(storage.sweep_loop())
+    asyncio.create_task(library.index_loop())
+    asyncio.create_task(history.flush_loop())
+    asyncio.create_task(monitor.run())
+    asyncio.create_task(manager.flush_loop())
+    asyncio.create_task(settings.watch())
+
+@app.on_event("shutdown")
+async def flush_history():
+    await history.flush()
+
 @app.get("/")
 async def get(request: Request):
     session_token = get_session_token(request)
@@ -170,6 +156,97 @@ async def debug_session(request: Request):
         "headers": dict(request.headers)
     }
 
+@app.get("/storage")
+async def storage_status(request: Request):
+    """Report free space and per-playlist quota usage"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return storage.status()
+
+@app.get("/library")
+async def library_status(request: Request):
+    """Report deduplication index statistics"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return library.status()
+
+@app.get("/library/lookup")
+async def library_lookup(request: Request, title: str):
+    """Map a track title to the tags of its canonical file"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return {"title": title, "canonical": library.lookup(title)}
+
+@app.get("/governor")
+async def governor_status(request: Request):
+    """Report the upstream rate governor's current state"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return governor.status()
+
+@app.get("/history/jobs")
+async def history_jobs(request: Request, page: int = 1, page_size: int = 50, status: str = ""):
+    """List past jobs, newest first"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    page_size = min(max(page_size, 1), 500)
+    return {"page": page, "page_size": page_size, "jobs": await history.list_jobs(max(page, 1), page_size, status)}
+
+@app.get("/history/tracks")
+async def history_tracks(request: Request, page: int = 1, page_size: int = 50, job_id: int = 0, outcome: str = "", sort: str = "recent"):
+    """List per-track outcomes, optionally for one job or outcome, sorted by recent or slowest
+
+    slowest orders by the gap since the job's previous track finished, not per-track download time.
+    """
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    page_size = min(max(page_size, 1), 500)
+    tracks = await history.list_tracks(max(page, 1), page_size, job_id, outcome, sort)
+    return {"page": page, "page_size": page_size, "tracks": tracks}
+
+@app.get("/loop")
+async def loop_status(request: Request):
+    """Report event loop lag"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return monitor.status()
+
+@app.get("/config")
+async def get_config(request: Request):
+    """Report current settings, with secrets masked"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return settings.public()
+
+@app.post("/config")
+async def update_config(request: Request):
+    """Change settings at runtime without restarting or interrupting running jobs"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    try:
+        values = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be valid JSON")
+    if not isinstance(values, dict):
+        raise HTTPException(status_code=400, detail="Expected a JSON object")
+    try:
+        changed = settings.update(values)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    print(f"🔄 Settings updated: {', '.join(changed) or 'no changes'}")
+    return {"changed": changed}
+
+@app.post("/config/reload")
+async def reload_config(request: Request):
+    """Re-read settings from the environment and CONFIG_FILE"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    try:
+        changed = settings.reload()
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"changed": changed}
+
 @app.post("/logout")
 async def logout(request: Request):
     session_token = get_session_token(request)
@@ -182,26 +259,68 @@ async def logout(request: Request):
     response.delete_cookie("session_token", path="/")
     return response
 
+async def run_admitted(query: str, playlist: str, job, names: list = None):
+    """Run spotdl once the job fits on disk, deferring instead of failing halfway
+
+    Quota violations raise QuotaExceeded straight away, since waiting won't free up quota.
+    Jobs with a playlist are sized from its ledger once spotdl reports the track count.
+    Bulk shards pass their track names and are sized from the files not yet on disk.
+    Other jobs can't tell new tracks from existing ones up front, so they check for room as each track lands.
+    """
+    deferrals = 0
+    while True:
+        try:
+            admit = None
+            if names is not None:
+                storage.admit(await asyncio.to_thread(storage.missing_tracks, names))
+            elif playlist:
+                storage.admit(0, playlist)
+                admit = lambda total: storage.admit(total, playlist)
+            else:
+                storage.admit(1)
+            return await run_spotdl(query, manager, state, admit=admit, job=job, check_space=lambda: storage.admit(1))
+        except RateLimited:
+            # The next launch waits out the governor's pause, and spotdl skips what's already on disk
+            await manager.broadcast(f"Restarting with {governor.threads()} threads once the rate limit pause ends")
+            continue
+        except JobDeferred as e:
+            reason = str(e)
+        deferrals += 1
+        if deferrals > settings.MAX_DEFERRALS:
+            raise RuntimeError(f"Not enough disk space after {settings.MAX_DEFERRALS} retries ({reason})")
+        # Clear out partial files before retrying
+        job.set_phase("deferred")
+        await manager.broadcast(f"Not enough disk space ({reason}), retry {deferrals}/{settings.MAX_DEFERRALS} in {settings.DEFER_INTERVAL}s")
+        await asyncio.to_thread(storage.sweep, 0)
+        await asyncio.sleep(settings.DEFER_INTERVAL)
+
 async def download_task(url: str):
+    job = tracker.start(url.split("---")[0])
     try:
         state.is_downloading = True
         parts = url.split("---")
+        await history.start_job(job, parts[1])
         if parts[1] != "":
             message = str("Adding songs to Playlist " + parts[1] + " When Complete")
             await manager.broadcast(message)
         # await manager.broadcast("Starting download...")
-        songs_to_add = []
-        songs_to_add = await run_spotdl(parts[0], manager, state)
+        songs_to_add = await run_admitted(parts[0], parts[1], job)
         print("songs to add",songs_to_add)
+        await asyncio.to_thread(storage.record_usage, parts[1], job.downloaded_tracks, len(songs_to_add or []))
+        # Fingerprint the new arrivals so duplicates are caught before the playlist is built
+        await asyncio.to_thread(library.scan)
 
         if parts[1] != "":
             message = str("Download complete now adding songs to playlist " + parts[1])
             await manager.broadcast(message)
-            await add_to_playlist(parts[1],songs_to_add,manager)
+            job.set_phase("playlist")
+            await add_to_playlist(parts[1],songs_to_add,manager,job)
             await manager.broadcast(f"{len(songs_to_add)} songs added to {parts[1]}")
 
-
-
+        job.finish()
+        await history.finish_job(job, "completed")
+        state.progress = job.to_dict()
+        await manager.broadcast_json(state.progress)
 
         state.is_downloading = False
         state.logs.append("[DONE]")
@@ -210,10 +329,107 @@ async def download_task(url: str):
     except Exception as e:
         error_msg = f"Download failed: {str(e)}"
         print(f"Download task error: {e}")
+        job.finish(error_msg)
+        await history.finish_job(job, "failed")
+        state.is_downloading = False
+        state.logs.append(error_msg)
+        await manager.broadcast(error_msg)
+        await manager.broadcast("[DONE]")
+
+async def bulk_import_task(pairs: list):
+    """Resolve every playlist, download each unique track once, then build every playlist"""
+    job = tracker.start(f"bulk import of {len(pairs)} playlists")
+    workdir = await asyncio.to_thread(make_workdir)
+    try:
+        state.is_downloading = True
+        await history.start_job(job, "")
+        # A url going into several playlists is only resolved once
+        urls = list(dict.fromkeys(url for url, _ in pairs))
+        resolved = {}
+        for index, url in enumerate(urls, 1):
+            await manager.broadcast(f"Resolving playlist {index}/{len(urls)}: {url}")
+            try:
+                resolved[url] = await resolve_playlist(url, workdir)
+            except (RuntimeError, OSError, ValueError) as e:
+                # One bad URL shouldn't sink the rest of the import
+                print(f"Bulk import resolve error: {e}")
+                await manager.broadcast(f"❌ Skipping {url}: {e}")
+        plan = TrackPlan()
+        for url, playlist in pairs:
+            if url in resolved:
+                plan.add(playlist, resolved[url])
+        if not plan.playlists:
+            raise RuntimeError("No playlists could be resolved")
+
+        # Each playlist's share of the plan has to fit its quota before anything is downloaded
+        for playlist in list(plan.playlists):
+            try:
+                storage.check_quota(len(plan.playlists[playlist]), playlist)
+            except QuotaExceeded as e:
+                await manager.broadcast(f"❌ Skipping {playlist}: {e}")
+                plan.remove(playlist)
+        if not plan.playlists:
+            raise RuntimeError("Every playlist is over its quota")
+        entries = sum(len(keys) for keys in plan.playlists.values())
+        await manager.broadcast(f"Found {len(plan.songs)} unique songs across {entries} playlist entries.")
+
+        job.set_total(len(plan.songs))
+        available = set()
+        shards = await asyncio.to_thread(plan.shards, workdir, settings.BULK_SHARD_SIZE)
+        for shard, names in shards:
+            job.set_phase("downloading")
+            available.update(await run_admitted(shard, "", job, names) or [])
+        await asyncio.to_thread(library.scan)
+
+        job.set_phase("playlist")
+        downloaded = set(job.downloaded_tracks)
+        id_cache = {}
+        scan = True
+        for playlist in plan.playlists:
+            if not playlist:
+                continue
+            titles = plan.titles_for(playlist, available)
+            await add_to_playlist(playlist, titles, manager, job, scan=scan, id_cache=id_cache)
+            await asyncio.to_thread(storage.record_usage, playlist, [title for title in titles if title in downloaded], len(titles))
+            await manager.broadcast(f"{len(titles)} songs added to {playlist}")
+            # One library scan covers every playlist
+            scan = False
+
+        job.finish()
+        await history.finish_job(job, "completed")
+        state.progress = job.to_dict()
+        await manager.broadcast_json(state.progress)
+        state.is_downloading = False
+        state.logs.append("[DONE]")
+        await manager.broadcast("[DONE]")
+
+    except Exception as e:
+        error_msg = f"Bulk import failed: {str(e)}"
+        print(f"Bulk import error: {e}")
+        job.finish(error_msg)
+        await history.finish_job(job, "failed")
         state.is_downloading = False
         state.logs.append(error_msg)
         await manager.broadcast(error_msg)
         await manager.broadcast("[DONE]")
+    finally:
+        await asyncio.to_thread(shutil.rmtree, workdir, ignore_errors=True)
+
+@app.post("/bulk-import")
+async def bulk_import(request: Request, file: UploadFile = File(...)):
+    """Import many url -> playlist pairs from a CSV or JSON file"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    try:
+        pairs = parse_import((await file.read()).decode("utf-8"))
+    except (ValueError, KeyError, TypeError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid import file: {e}")
+    if state.is_downloading:
+        raise HTTPException(status_code=409, detail="A download is already in progress.")
+    state.reset()
+    state.is_downloading = True
+    asyncio.create_task(bulk_import_task(pairs))
+    return {"playlists": len(pairs)}
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -223,22 +439,22 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close(code=4001, reason="Authentication required")
         return
 
-    await manager.connect(websocket)
+    await manager.connect(websocket, websocket.query_params.get("protocol", "text"))
     try:
         # Send current state to the newly connected client
-        for log in state.logs:
-            await websocket.send_text(log)
-        if state.progress:
-            await websocket.send_json(state.progress)
+        await manager.send(websocket, state.logs, [state.progress] if state.progress else [])
 
         while True:
             url = await websocket.receive_text()
             print(url)
+            if url == "[SUMMARY]":
+                await manager.send(websocket, messages=[tracker.summary()])
+                continue
             if not state.is_downloading:
                 state.reset()
                 asyncio.create_task(download_task(url))
             else:
-                await websocket.send_text("A download is already in progress.")
+                await manager.send(websocket, logs=["A download is already in progress."])
 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import itertools
+import time
+from collections import OrderedDict
+from config import settings
+
+# Weight of the newest interval in the tracks/second moving average
+EWMA_ALPHA = 0.3
+
+class JobProgress:
+    def __init__(self, job_id: int, url: str):
+        self.job_id = job_id
+        self.url = url
+        self.total = 0
+        self.downloaded = 0
+        self.skipped = 0
+        self.failed = 0
+        # Names of tracks this job actually downloaded, as opposed to skipped
+        self.downloaded_tracks = []
+        self.track = "Starting download..."
+        self.started = time.monotonic()
+        self.last_completion = self.started
+        self.avg_interval = None
+        self.phase = ""
+        self.phase_started = self.started
+        self.phases = {}
+        self.finished = False
+        self.set_phase("resolving")
+
+    def set_phase(self, phase: str):
+        now = time.monotonic()
+        if self.phase:
+            self.phases[self.phase] = self.phases.get(self.phase, 0) + now - self.phase_started
+        self.phase = phase
+        self.phase_started = now
+
+    def set_total(self, total: int):
+        self.total = total
+        self.set_phase("downloading")
+        # Don't count resolving time against the first track
+        self.last_completion = time.monotonic()
+
+    def complete(self, outcome: str, track: str = "") -> float:
+        """Record a finished track (downloaded, skipped or failed), update the rate and return its interval"""
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        if track:
+            self.track = track
+            if outcome == "downloaded":
+                self.downloaded_tracks.append(track)
+        now = time.monotonic()
+        interval = now - self.last_completion
+        self.last_completion = now
+        if self.avg_interval is None:
+            self.avg_interval = interval
+        else:
+            self.avg_interval = EWMA_ALPHA * interval + (1 - EWMA_ALPHA) * self.avg_interval
+        return interval
+
+    def finish(self, track: str = ""):
+        if track:
+            self.track = track
+        self.set_phase("done")
+        self.finished = True
+
+    def rate(self) -> float:
+        if not self.avg_interval:
+            return 0.0
+        return 1 / self.avg_interval
+
+    def eta(self):
+        remaining = self.total - self.downloaded - self.skipped - self.failed
+        if self.finished or self.total == 0:
+            return None
+        if self.rate() == 0:
+            return None
+        return max(remaining, 0) / self.rate()
+
+    def to_dict(self) -> dict:
+        phases = dict(self.phases)
+        if not self.finished:
+            phases[self.phase] = phases.get(self.phase, 0) + time.monotonic() - self.phase_started
+        eta = self.eta()
+        return {
+            "type": "progress",
+            "job_id": self.job_id,
+            "current": self.downloaded,
+            "total": self.total,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "track": self.track,
+            "phase": self.phase,
+            "rate": round(self.rate(), 3),
+            "eta": round(eta, 1) if eta is not None else None,
+            "elapsed": round(time.monotonic() - self.started, 1),
+            "phases": {name: round(seconds, 1) for name, seconds in phases.items()},
+        }
+
+class ProgressTracker:
+    def __init__(self):
+        self.jobs = OrderedDict()
+        self.ids = itertools.count(1)
+
+    def start(self, url: str) -> JobProgress:
+        job = JobProgress(next(self.ids), url)
+        self.jobs[job.job_id] = job
+        finished = [job_id for job_id, j in self.jobs.items() if j.finished]
+        for job_id in finished[:len(finished) - settings.PROGRESS_JOBS_KEPT]:
+            del self.jobs[job_id]
+        return job
+
+    def summary(self) -> dict:
+        """All running and recently finished jobs, slowest running job first"""
+        jobs = sorted(self.jobs.values(), key=lambda j: (j.finished, j.rate()))
+        return {"type": "summary", "jobs": [dict(j.to_dict(), url=j.url) for j in jobs]}
+
+tracker = ProgressTracker()
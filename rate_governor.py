@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import asyncio
+import re
+import time
+from config import settings
+
+# Messages in spotdl / yt-dlp log lines that mean Spotify or YouTube is throttling us.
+# Kept specific so track names can't trigger a backoff.
+RATE_LIMIT_PATTERN = re.compile(
+    r"HTTP Error 429|Too Many Requests|Sign in to confirm you.re not a bot",
+    re.IGNORECASE,
+)
+
+# Lowest fraction of the configured rate the governor will back off to
+MIN_FACTOR = 0.1
+
+class RateLimited(Exception):
+    """Raised to stop a spotdl run that hit a rate limit, so it restarts with fewer threads"""
+
+def is_rate_limited(line: str) -> bool:
+    """Whether a line of spotdl output is a WARNING/ERROR log line reporting throttling"""
+    if not line.startswith(("WARNING:", "ERROR:")):
+        return False
+    return RATE_LIMIT_PATTERN.search(line) is not None
+
+class RateGovernor:
+    """Token bucket shared by every spotdl launch, backing off when upstream throttles us"""
+
+    def __init__(self):
+        self.factor = 1.0
+        self.tokens = float(settings.GOVERNOR_BURST)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # Consecutive backoffs, each one doubling the pause
+        self.backoffs = 0
+        self.last_limited = 0.0
+        self.rate_limit_hits = 0
+        self.lock = asyncio.Lock()
+
+    def cooldown(self) -> float:
+        return min(settings.GOVERNOR_COOLDOWN * 2 ** self.backoffs, settings.GOVERNOR_MAX_COOLDOWN)
+
+    def rate(self) -> float:
+        return settings.GOVERNOR_RATE * self.factor
+
+    def refill(self):
+        now = time.monotonic()
+        # Additive recovery once upstream has been quiet for a full cooldown
+        if self.factor < 1 and now - self.last_limited > self.cooldown():
+            self.factor = min(1.0, self.factor + 0.1)
+            self.last_limited = now
+            if self.factor == 1:
+                self.backoffs = 0
+        self.tokens = min(settings.GOVERNOR_BURST, self.tokens + (now - self.updated) * self.rate())
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a request to upstream is allowed"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate())
+
+    def threads(self) -> int:
+        """spotdl --threads for a new launch, scaled down while backing off"""
+        return max(1, round(settings.SPOTDL_THREADS * self.factor))
+
+    def report_rate_limit(self) -> bool:
+        """Halve the rate and pause everyone, doubling the pause on repeated hits
+
+        Returns False if the governor was already paused and nothing changed.
+        """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        self.rate_limit_hits += 1
+        self.factor = max(MIN_FACTOR, self.factor / 2)
+        self.tokens = 0
+        self.paused_until = now + self.cooldown()
+        self.last_limited = self.paused_until
+        print(f"🚦 Upstream rate limit detected, pausing {self.cooldown()}s at {self.factor:.0%} rate")
+        self.backoffs += 1
+        return True
+
+    def status(self) -> dict:
+        self.refill()
+        return {
+            "rate_per_second": round(self.rate(), 3),
+            "factor": round(self.factor, 2),
+            "tokens": round(self.tokens, 2),
+            "threads": self.threads(),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 1),
+            "cooldown": self.cooldown(),
+            "rate_limit_hits": self.rate_limit_hits,
+        }
+
+governor = RateGovernor()
@@ -40,6 +40,7 @@ if __name__ == "__main__":
             host="0.0.0.0",
             port=8000,
             reload=False,
+            ws_per_message_deflate=settings.WS_DEFLATE,
         )
     except Exception as e:
         print(f"❌ Failed to start server: {e}")
@@ -1,13 +1,46 @@
 #!/usr/bin/env python3
 import asyncio
+import codecs
 import re
+from config import settings
+from storage import AdmissionError
+from progress import tracker
+from rate_governor import governor, is_rate_limited, RateLimited
+from history import history
 
-async def run_spotdl(url: str, manager, state):
+async def stop(process):
+    try:
+        process.terminate()
+    except ProcessLookupError:
+        # spotdl already exited
+        pass
+    await process.wait()
+
+async def stop_for(process, check, *args):
+    """Run an admission check, terminating spotdl before re-raising if it fails"""
+    try:
+        check(*args)
+    except AdmissionError:
+        await stop(process)
+        raise
+
+async def run_spotdl(url: str, manager, state, admit=None, job=None, check_space=None):
+    """Run one spotdl download, returning the names of tracks downloaded or already on disk
+
+    admit is called with the track count once spotdl has resolved the query, and
+    check_space after every downloaded track. Either may raise AdmissionError to stop the run.
+    Raises RateLimited if upstream throttles us, since --threads can't be lowered mid-run.
+    """
+    if job is None:
+        job = tracker.start(url)
 
     try:
+        # Every launch goes through the shared governor so parallel jobs don't get us throttled
+        await governor.acquire()
         # Run spotdl with verbose output
         process = await asyncio.create_subprocess_exec(
-            'spotdl', 'download', url, '--format', 'mp3', '--bitrate', '320k', '--output', './downloads',
+            'spotdl', 'download', url, '--format', 'mp3', '--bitrate', settings.BITRATE, '--output', settings.DOWNLOAD_DIR,
+            '--threads', str(governor.threads()),
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.STDOUT
         )
@@ -24,121 +57,133 @@ async def run_spotdl(url: str, manager, state):
 
         print("Capturing output...")
 
+        # spotdl prints several lines per read once it runs with --threads, so handle every line
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        buffer = ""
+
         while True:
             if process.stdout is None:
                 break
 
             chunk = await process.stdout.read(32768)
+            buffer += decoder.decode(chunk, final=not chunk)
+            lines = re.split(r'[\r\n]', buffer)
+            # Keep a trailing partial line for the next read
+            buffer = lines.pop() if chunk else ""
+
+            for line in lines:
+                stripped_line = line.strip()
+
+                if is_rate_limited(stripped_line) and governor.report_rate_limit():
+                    asyncio.create_task(manager.broadcast("Upstream rate limit hit, slowing down"))
+                    await stop(process)
+                    raise RateLimited(stripped_line)
+
+                # Filter out INFO messages from spotdl
+                if stripped_line.startswith("INFO:spotdl."):
+                    continue
+
+                # Filter out other logging messages
+                if stripped_line.startswith("DEBUG:") or stripped_line.startswith("WARNING:") or stripped_line.startswith("ERROR:"):
+                    continue
+
+                if stripped_line == "":
+                    continue
+
+                # find total songs
+                found = re.match(r'Found (\d+)', stripped_line)
+                if found and total_songs_to_download == "":
+                    total_songs_to_download = found.group(1)
+                    print("Total Songs:", total_songs_to_download)
+
+                    # Stop before any tracks land on disk if the job doesn't fit
+                    if admit is not None:
+                        await stop_for(process, admit, int(total_songs_to_download))
+
+                    # Bulk imports set the total for all shards up front
+                    if not job.total:
+                        job.set_total(int(total_songs_to_download))
+                    progress = job.to_dict()
+                    state.progress = progress
+                    asyncio.create_task(manager.broadcast_json(progress))
+                    asyncio.create_task(manager.broadcast(f"Found {total_songs_to_download} songs to download."))
+
+                #identify skipped tracks
+                if stripped_line.startswith("Skipping"):
+                    skipped_track_name = stripped_line[9:]
+                    skipped_track_name = ' '.join(skipped_track_name.split())
+                    skipped_track_name = skipped_track_name.replace("(file already exists) (duplicate)","")
+                    skipped_track_name = skipped_track_name.replace("(file already exists)(duplicate)","")
+                    skipped_track_name = skipped_track_name.replace("(file already exists)","")
+                    skipped_track_name = skipped_track_name.strip()
+                    songs_skipped.append(skipped_track_name)
+                    print("Skipped:",skipped_track_name)
+                    # A retried run skips what the deferred run already downloaded, don't count those twice
+                    if skipped_track_name in job.downloaded_tracks:
+                        continue
+                    history.record_track(job, skipped_track_name, "skipped", job.complete("skipped"))
+                    state.progress = job.to_dict()
+                    asyncio.create_task(manager.broadcast_json(state.progress))
+                    asyncio.create_task(manager.broadcast(f"Skipped: {skipped_track_name}"))
+
+                #identify downloaded tracks
+                if stripped_line.startswith("Downloaded"):
+                    downloaded_track_name = stripped_line[11:]
+                    downloaded_track_name = re.sub(r'https?://\S+', '', downloaded_track_name).strip()
+                    downloaded_track_name = downloaded_track_name.strip(' "\':\n\r\t')
+                    songs_downloaded.append(downloaded_track_name)
+                    print("Downloaded:", downloaded_track_name)
+                    seconds = job.complete("downloaded", downloaded_track_name)
+                    history.record_track(job, downloaded_track_name, "downloaded", seconds)
+                    progress = job.to_dict()
+                    state.progress = progress
+                    asyncio.create_task(manager.broadcast_json(progress))
+                    asyncio.create_task(manager.broadcast(f"Downloaded: {downloaded_track_name}"))
+                    if check_space is not None:
+                        await stop_for(process, check_space)
+
+                #identify failed lookups
+                if stripped_line.startswith("LookupError"):
+                    errored_track_name = stripped_line[40:]
+                    songs_lookup_failed.append(errored_track_name)
+                    print("Failed:", errored_track_name)
+                    history.record_track(job, errored_track_name, "failed", job.complete("failed"))
+                    state.progress = job.to_dict()
+                    asyncio.create_task(manager.broadcast_json(state.progress))
+                    asyncio.create_task(manager.broadcast(f"Failed to lookup song: {errored_track_name}"))
+
             if not chunk:
                 break
+            print_progress()
 
-            decoded_chunk = chunk.decode('utf-8', errors='ignore')
-            stripped_chunk = decoded_chunk.strip()
-
-            # Filter out INFO messages from spotdl
-            if stripped_chunk.startswith("INFO:spotdl."):
-                continue
-            
-            # Filter out other logging messages
-            if stripped_chunk.startswith("DEBUG:") or stripped_chunk.startswith("WARNING:") or stripped_chunk.startswith("ERROR:"):
-                continue
-
-            # print("stripped chunk is:",stripped_chunk,"end of stripped chunk")
-
-            if stripped_chunk == "":
-
-                end_message = "Completed"
-
-                # list failed songs
-                if not(len(songs_lookup_failed) == 0):
-                    print("failed to find")
-                    for i in songs_lookup_failed:
-                        print(i)
-                    print(len(songs_lookup_failed),"Songs not found")
-                    end_message += (" " + str(len(songs_lookup_failed)) + " Song/s not found")
-
-                # list already present songs
-                if len(songs_skipped) != 0:
-                    print("already present")
-                    for i in songs_skipped:
-                        print(i)
-                    print("end songs skipped")
-                end_message += (" " + str(len(songs_skipped)) + " Song/s alredy present")
-
-
-                progress = {
-                    "type": "progress",
-                    "current": len(songs_downloaded),
-                    "total": total_songs_to_download,
-                    "track": end_message
-                }
-                state.progress = progress
-                asyncio.create_task(manager.broadcast_json(progress))
-                break
+        await process.wait()
 
-            # find total songs
-            if "F" in stripped_chunk[0] and total_songs_to_download == "":
-                index = 6
-                while stripped_chunk[index].isdigit():
-                    if stripped_chunk[index].isdigit():
-                        total_songs_to_download += stripped_chunk[index]
-                        index += 1
-                print("Total Songs:", total_songs_to_download)
-
-                progress = {
-                    "type": "progress",
-                    "current": 0,
-                    "total": total_songs_to_download,
-                    "track": "Starting download..."
-                }
-                state.progress = progress
-                asyncio.create_task(manager.broadcast_json(progress))
-                asyncio.create_task(manager.broadcast(f"Found {total_songs_to_download} songs to download."))
-
-            #identify skipped tracks
-            if "S" in stripped_chunk[0]:
-                skipped_track_name = stripped_chunk[9:]
-                skipped_track_name = skipped_track_name.replace("\n","")
-                skipped_track_name = ' '.join(skipped_track_name.split())
-                skipped_track_name = skipped_track_name.replace("(file already exists) (duplicate)","")
-                skipped_track_name = skipped_track_name.replace("(file already exists)(duplicate)","")
-                skipped_track_name = skipped_track_name.replace("(filealready exists) (duplicate)","")
-                skipped_track_name = skipped_track_name.strip()
-                songs_skipped.append(skipped_track_name)
-                print("Skipped:",skipped_track_name)
-                asyncio.create_task(manager.broadcast(f"Skipped: {skipped_track_name}"))
-
-
-            #identify downloaded tracks
-            if "D" in stripped_chunk[0]:
-                downloaded_track_name = stripped_chunk[12:]
-                downloaded_track_name = re.sub(r'https?://\S+', '', downloaded_track_name).strip()
-                downloaded_track_name = downloaded_track_name.strip(' "\':\n\r\t')
-                songs_downloaded.append(downloaded_track_name)
-                print("Downloaded:", downloaded_track_name)
-                progress = {
-                    "type": "progress",
-                    "current": len(songs_downloaded),
-                    "total": total_songs_to_download,
-                    "track": downloaded_track_name
-                }
-                state.progress = progress
-                asyncio.create_task(manager.broadcast_json(progress))
-                asyncio.create_task(manager.broadcast(f"Downloaded: {downloaded_track_name}"))
-
-            #identify failed lookups
-            if "L" in stripped_chunk[0]:
-                errored_track_name = stripped_chunk[40:]
-                songs_lookup_failed.append(errored_track_name)
-                print("Failed:", errored_track_name)
-                asyncio.create_task(manager.broadcast(f"Failed to lookup song: {errored_track_name}"))
+        end_message = "Completed"
 
-            print_progress()
+        # list failed songs
+        if not(len(songs_lookup_failed) == 0):
+            print("failed to find")
+            for i in songs_lookup_failed:
+                print(i)
+            print(len(songs_lookup_failed),"Songs not found")
+            end_message += (" " + str(len(songs_lookup_failed)) + " Song/s not found")
 
-            for i in songs_downloaded:
+        # list already present songs
+        if len(songs_skipped) != 0:
+            print("already present")
+            for i in songs_skipped:
                 print(i)
+            print("end songs skipped")
+        end_message += (" " + str(len(songs_skipped)) + " Song/s alredy present")
+
+        job.track = end_message
+        job.set_phase("indexing")
+        progress = job.to_dict()
+        state.progress = progress
+        asyncio.create_task(manager.broadcast_json(progress))
         return songs_downloaded + songs_skipped
 
-
+    except (AdmissionError, RateLimited):
+        raise
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import os
+import shutil
+import time
+from config import settings
+
+# Files left behind by yt-dlp / ffmpeg when a download is interrupted
+PARTIAL_SUFFIXES = (".part", ".ytdl", ".temp", ".tmp")
+# Temporary hardlinks made by the library indexer, which may be mid-rename in another thread
+INDEX_TEMP_SUFFIX = ".indextmp"
+QUOTA_FILE = ".quota.json"
+
+class AdmissionError(Exception):
+    """Raised when storage won't let a job start"""
+
+class JobDeferred(AdmissionError):
+    """Raised when a job doesn't fit on disk right now and should be retried later"""
+
+class QuotaExceeded(AdmissionError):
+    """Raised when a job would take its playlist over quota, which retrying won't fix"""
+
+class StorageGuard:
+    def __init__(self, root: str):
+        self.root = root
+        self.usage = {}
+        os.makedirs(self.root, exist_ok=True)
+        self.load_usage()
+
+    def bitrate_kbps(self) -> int:
+        return int(settings.BITRATE.rstrip("kK"))
+
+    def estimate_job_bytes(self, track_count: int) -> int:
+        """Estimate how much space a job needs from its track count and bitrate"""
+        bytes_per_track = self.bitrate_kbps() * 1000 // 8 * settings.AVG_TRACK_SECONDS
+        return track_count * bytes_per_track
+
+    def free_bytes(self) -> int:
+        return shutil.disk_usage(self.root).free
+
+    def missing_tracks(self, names: list) -> int:
+        """How many of these tracks have no file on disk yet, which spotdl would have to download"""
+        return sum(not os.path.exists(os.path.join(self.root, name + ".mp3")) for name in names)
+
+    def new_tracks(self, track_count: int, playlist: str = "") -> int:
+        """Tracks a job will actually download, leaving out those its playlist already has on disk"""
+        if not playlist:
+            return track_count
+        return max(track_count - self.usage.get(playlist, {}).get("tracks", 0), 0)
+
+    def check_quota(self, track_count: int, playlist: str):
+        """Raise QuotaExceeded if track_count tracks would take the playlist over quota"""
+        if not playlist or settings.PLAYLIST_QUOTA_MB <= 0:
+            return
+        needed = self.estimate_job_bytes(self.new_tracks(track_count, playlist))
+        quota = settings.PLAYLIST_QUOTA_MB * 1024 * 1024
+        used = self.usage.get(playlist, {}).get("bytes", 0)
+        if used + needed > quota:
+            raise QuotaExceeded(f"playlist {playlist} would exceed its {settings.PLAYLIST_QUOTA_MB} MB quota")
+
+    def admit(self, track_count: int, playlist: str = ""):
+        """Raise QuotaExceeded or JobDeferred if the job doesn't fit"""
+        self.check_quota(track_count, playlist)
+
+        needed = self.estimate_job_bytes(self.new_tracks(track_count, playlist))
+        available = self.free_bytes() - settings.MIN_FREE_MB * 1024 * 1024
+        if needed > available:
+            raise JobDeferred(f"needs ~{needed // 1048576} MB but only {max(available, 0) // 1048576} MB is free")
+
+    def load_usage(self):
+        try:
+            with open(os.path.join(self.root, QUOTA_FILE)) as f:
+                self.usage = json.load(f)
+        except (OSError, ValueError):
+            self.usage = {}
+        for playlist, used in self.usage.items():
+            # Older ledgers only stored bytes
+            if isinstance(used, int):
+                self.usage[playlist] = {"bytes": used, "tracks": 0}
+
+    def record_usage(self, playlist: str, downloaded: list, track_count: int):
+        """Add the size of a job's newly downloaded files to its playlist's usage
+
+        track_count is how many of the playlist's tracks are now on disk, downloaded or skipped.
+        """
+        if not playlist:
+            return
+        total = 0
+        for song in downloaded:
+            path = os.path.join(self.root, song + ".mp3")
+            if os.path.isfile(path):
+                total += os.path.getsize(path)
+        used = self.usage.setdefault(playlist, {"bytes": 0, "tracks": 0})
+        used["bytes"] += total
+        used["tracks"] = max(used["tracks"], track_count)
+        try:
+            with open(os.path.join(self.root, QUOTA_FILE), "w") as f:
+                json.dump(self.usage, f)
+        except OSError as e:
+            print(f"Error saving quota usage: {e}")
+
+    def sweep(self, max_age: int) -> int:
+        """Remove partial and empty files older than max_age seconds"""
+        removed = 0
+        now = time.time()
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                    # Index temp files are only orphans if the indexer died, so always give them the full age
+                    age = settings.PARTIAL_MAX_AGE if name.endswith(INDEX_TEMP_SUFFIX) else max_age
+                    if stat.st_mtime > now - age:
+                        continue
+                    if name.endswith(PARTIAL_SUFFIXES + (INDEX_TEMP_SUFFIX,)) or (name.endswith(".mp3") and stat.st_size == 0):
+                        os.remove(path)
+                        removed += 1
+                        print(f"🧹 Removed partial file: {path}")
+                except OSError as e:
+                    print(f"Error sweeping {path}: {e}")
+        return removed
+
+    async def sweep_loop(self):
+        while True:
+            await asyncio.to_thread(self.sweep, settings.PARTIAL_MAX_AGE)
+            await asyncio.sleep(settings.SWEEP_INTERVAL)
+
+    def status(self) -> dict:
+        return {
+            "download_dir": self.root,
+            "free_mb": self.free_bytes() // 1048576,
+            "min_free_mb": settings.MIN_FREE_MB,
+            "playlist_quota_mb": settings.PLAYLIST_QUOTA_MB,
+            "playlist_usage_mb": {name: used["bytes"] // 1048576 for name, used in self.usage.items()},
+        }
+
+storage = StorageGuard(settings.DOWNLOAD_DIR)
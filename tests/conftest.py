@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Keep the app's module-level singletons (storage, history, library index) out of ./downloads
+os.environ.setdefault("DOWNLOAD_DIR", tempfile.mkdtemp(prefix="spotdl-web-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,64 @@
+import json
+import pytest
+from bulk_import import parse_import, display_name, TrackPlan
+
+def song(song_id, name, artists):
+    return {"song_id": song_id, "name": name, "artist": artists[0], "artists": artists}
+
+def test_parse_csv_with_header():
+    text = "url,playlist\nhttps://a, Road Trip \nhttps://b\n\n"
+    assert parse_import(text) == [("https://a", "Road Trip"), ("https://b", "")]
+
+def test_parse_json_list_and_object():
+    assert parse_import('[{"url": "https://a", "playlist": "P"}, {"url": "https://b"}]') == [("https://a", "P"), ("https://b", "")]
+    assert parse_import('{"https://a": "P"}') == [("https://a", "P")]
+
+@pytest.mark.parametrize("text", ["", "url,playlist\n", "[]", '[{"url": "  "}]'])
+def test_parse_empty_import_is_rejected(text):
+    with pytest.raises(ValueError):
+        parse_import(text)
+
+def test_display_name_uses_main_artist():
+    assert display_name(song("1", "Track", ["Main", "Featured"])) == "Main - Track"
+
+def test_plan_dedupes_tracks_across_playlists():
+    plan = TrackPlan()
+    shared = song("1", "Shared", ["A", "B"])
+    plan.add("P", [shared, song("2", "Only P", ["A"])])
+    plan.add("Q", [shared, shared])
+    assert len(plan.songs) == 2
+    assert plan.playlists == {"P": ["1", "2"], "Q": ["1"]}
+
+def test_titles_for_matches_spotdl_output():
+    plan = TrackPlan()
+    plan.add("P", [song("1", "Shared", ["A", "B"]), song("2", "Missing", ["A"])])
+    assert plan.titles_for("P", {"A - Shared"}) == ["A - Shared"]
+
+def test_remove_keeps_tracks_other_playlists_want():
+    plan = TrackPlan()
+    shared = song("1", "Shared", ["A"])
+    plan.add("P", [shared, song("2", "Only P", ["A"])])
+    plan.add("Q", [shared])
+    plan.remove("P")
+    assert list(plan.songs) == ["1"]
+    assert list(plan.playlists) == ["Q"]
+
+def test_shards_split_unique_tracks(tmp_path):
+    plan = TrackPlan()
+    plan.add("P", [song(str(i), f"T{i}", ["A"]) for i in range(5)])
+    shards = plan.shards(str(tmp_path), 2)
+    sizes = []
+    for path, names in shards:
+        with open(path) as f:
+            sizes.append(len(json.load(f)))
+    assert sizes == [2, 2, 1]
+    assert shards[2][1] == ["A - T4"]
+
+@pytest.mark.parametrize("text", ['{"https://a": 1}', '[{"url": 5}]', '[{"url": "https://a", "playlist": null}]'])
+def test_parse_non_string_values_are_rejected(text):
+    with pytest.raises(ValueError):
+        parse_import(text)
+
+def test_parse_drops_repeated_pairs():
+    text = "https://a,P\nhttps://a, P\nhttps://a,Q\n"
+    assert parse_import(text) == [("https://a", "P"), ("https://a", "Q")]
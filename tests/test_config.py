@@ -0,0 +1,73 @@
+import json
+import pytest
+from config import Field, Settings
+
+def test_int_field_parses_strings_from_environment():
+    assert Field(int, 0).parse("X", "3") == 3
+
+@pytest.mark.parametrize("raw", [2.9, "2.9", True, "many"])
+def test_int_field_rejects_non_integers(raw):
+    with pytest.raises(ValueError):
+        Field(int, 0).parse("X", raw)
+
+def test_int_field_accepts_integral_float():
+    assert Field(int, 0).parse("X", 2.0) == 2
+
+@pytest.mark.parametrize("raw,expected", [
+    ("TRUE", True), ("1", True), ("yes", True), ("on", True),
+    ("false", False), ("0", False), ("No", False), ("off", False),
+])
+def test_bool_field_accepts_common_spellings(raw, expected):
+    assert Field(bool, False).parse("X", raw) is expected
+
+def test_bool_field_rejects_other_strings():
+    with pytest.raises(ValueError):
+        Field(bool, False).parse("X", "maybe")
+
+def test_minimum_choices_and_pattern():
+    with pytest.raises(ValueError):
+        Field(int, 1, minimum=1).parse("X", 0)
+    with pytest.raises(ValueError):
+        Field(str, "a", choices=("a", "b")).parse("X", "c")
+    with pytest.raises(ValueError):
+        Field(str, "320k", pattern=r"\d+[kK]").parse("X", "320")
+
+def test_file_overrides_environment(tmp_path, monkeypatch):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"SPOTDL_THREADS": 8}))
+    monkeypatch.setenv("CONFIG_FILE", str(config_file))
+    monkeypatch.setenv("SPOTDL_THREADS", "2")
+    monkeypatch.setenv("GOVERNOR_BURST", "5")
+    settings = Settings()
+    assert settings.SPOTDL_THREADS == 8
+    assert settings.GOVERNOR_BURST == 5
+
+def test_invalid_update_keeps_current_values(monkeypatch):
+    monkeypatch.delenv("CONFIG_FILE", raising=False)
+    settings = Settings()
+    assert settings.update({"GOVERNOR_RATE": 0.5}) == ["GOVERNOR_RATE"]
+    with pytest.raises(ValueError):
+        settings.update({"GOVERNOR_RATE": 1.0, "GOVERNOR_BURST": 2.9})
+    with pytest.raises(ValueError):
+        settings.update({"NOT_A_SETTING": 1})
+    assert settings.GOVERNOR_RATE == 0.5
+    assert settings.overrides == {"GOVERNOR_RATE": 0.5}
+
+def test_cooldown_cannot_exceed_max_cooldown(monkeypatch):
+    monkeypatch.delenv("CONFIG_FILE", raising=False)
+    settings = Settings()
+    with pytest.raises(ValueError):
+        settings.update({"GOVERNOR_COOLDOWN": 900})
+    assert settings.update({"GOVERNOR_COOLDOWN": 900, "GOVERNOR_MAX_COOLDOWN": 1200}) == ["GOVERNOR_COOLDOWN", "GOVERNOR_MAX_COOLDOWN"]
+
+def test_restart_only_fields_are_not_changed_at_runtime(monkeypatch):
+    monkeypatch.delenv("CONFIG_FILE", raising=False)
+    settings = Settings()
+    before = settings.DOWNLOAD_DIR
+    assert settings.update({"DOWNLOAD_DIR": "/elsewhere"}) == []
+    assert settings.DOWNLOAD_DIR == before
+
+def test_public_masks_secrets(monkeypatch):
+    monkeypatch.setenv("PIN", "9999")
+    settings = Settings()
+    assert settings.public()["PIN"]["value"] == "***"
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import msgpack
+from connections import ConnectionManager
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.frames.append(text)
+
+    async def send_json(self, data):
+        self.frames.append(data)
+
+    async def send_bytes(self, data):
+        self.frames.append(msgpack.unpackb(data))
+
+def progress(current):
+    return {"type": "progress", "current": current}
+
+def test_text_clients_get_every_message_unbatched():
+    async def main():
+        manager = ConnectionManager()
+        text, batch = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(text)
+        await manager.connect(batch, "batch")
+        await manager.broadcast("Downloaded: A - One")
+        await manager.broadcast_json(progress(1))
+        await manager.broadcast_json(progress(2))
+        assert text.frames == ["Downloaded: A - One", progress(1), progress(2)]
+        assert batch.frames == []
+    asyncio.run(main())
+
+def test_flush_coalesces_to_the_latest_progress():
+    async def main():
+        manager = ConnectionManager()
+        batch = FakeWebSocket()
+        await manager.connect(batch, "batch")
+        await manager.broadcast("Downloaded: A - One")
+        await manager.broadcast_json({"type": "summary", "jobs": []})
+        await manager.broadcast_json(progress(1))
+        await manager.broadcast_json(progress(2))
+        await manager.flush()
+        await manager.flush()
+        assert [json.loads(frame) for frame in batch.frames] == [{
+            "type": "batch",
+            "logs": ["Downloaded: A - One"],
+            "messages": [{"type": "summary", "jobs": []}, progress(2)],
+        }]
+    asyncio.run(main())
+
+def test_msgpack_clients_get_binary_frames():
+    async def main():
+        manager = ConnectionManager()
+        client = FakeWebSocket()
+        await manager.connect(client, "msgpack")
+        await manager.send(client, ["[DONE]"], [progress(3)])
+        await manager.broadcast_json(progress(4))
+        await manager.flush()
+        assert client.frames == [
+            {"type": "batch", "logs": ["[DONE]"], "messages": [progress(3)]},
+            {"type": "batch", "logs": [], "messages": [progress(4)]},
+        ]
+    asyncio.run(main())
+
+def test_unknown_protocol_falls_back_to_text():
+    async def main():
+        manager = ConnectionManager()
+        client = FakeWebSocket()
+        await manager.connect(client, "gzip")
+        await manager.send(client, ["hello"], [progress(1)])
+        assert client.frames == ["hello", progress(1)]
+    asyncio.run(main())
+
+def test_client_joining_mid_job_gets_progress_once():
+    async def main():
+        manager = ConnectionManager()
+        existing, joining = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(existing, "batch")
+        await manager.broadcast_json(progress(5))
+        await manager.connect(joining, "batch")
+        # What the /ws endpoint sends a new client
+        await manager.send(joining, [], [progress(5)])
+        await manager.flush()
+        assert [json.loads(frame)["messages"] for frame in joining.frames] == [[progress(5)]]
+        assert [json.loads(frame)["messages"] for frame in existing.frames] == [[progress(5)]]
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from config import settings
+from history import HistoryStore
+from progress import JobProgress
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_BATCH_SIZE", 1000)
+    return HistoryStore(str(tmp_path / "history.db"))
+
+async def record_job(store, job_id, outcomes, status="completed"):
+    job = JobProgress(job_id, f"https://open.spotify.com/playlist/{job_id}")
+    await store.start_job(job, "")
+    for title, outcome, seconds in outcomes:
+        store.record_track(job, title, outcome, seconds)
+    await store.finish_job(job, status)
+
+def test_tracks_filter_sort_and_paginate(store):
+    async def main():
+        await record_job(store, 1, [("A", "downloaded", 1.0), ("B", "failed", 9.0), ("C", "downloaded", 5.0)])
+        await record_job(store, 2, [("D", "downloaded", 7.0)], status="failed")
+        slowest = await store.list_tracks(1, 2, sort="slowest")
+        assert [track["title"] for track in slowest] == ["B", "D"]
+        assert [track["title"] for track in await store.list_tracks(2, 2, sort="slowest")] == ["C", "A"]
+        downloaded = await store.list_tracks(1, 10, job_id=1, outcome="downloaded", sort="slowest")
+        assert [track["title"] for track in downloaded] == ["C", "A"]
+        failed_jobs = await store.list_jobs(1, 10, "failed")
+        assert [job["url"] for job in failed_jobs] == ["https://open.spotify.com/playlist/2"]
+        assert len(await store.list_jobs(1, 1)) == 1
+        assert await store.list_jobs(3, 1) == []
+    asyncio.run(main())
+
+def test_match_is_recorded_after_its_track(store):
+    async def main():
+        job = JobProgress(1, "url")
+        await store.start_job(job, "P")
+        store.record_track(job, "A - One", "downloaded", 1.0)
+        first = asyncio.create_task(store.flush())
+        # Queued while the first batch is still being written
+        await asyncio.sleep(0)
+        store.record_match(job, "A - One", "nav-1")
+        await asyncio.gather(first, store.flush())
+        tracks = await store.list_tracks(1, 10)
+        assert tracks[0]["navidrome_id"] == "nav-1"
+    asyncio.run(main())
+
+def test_finish_job_writes_counts(store):
+    async def main():
+        job = JobProgress(1, "url")
+        await store.start_job(job, "")
+        job.set_total(3)
+        job.complete("downloaded", "A")
+        job.complete("skipped", "B")
+        await store.finish_job(job, "completed")
+        saved = (await store.list_jobs(1, 10))[0]
+        assert (saved["status"], saved["total"], saved["downloaded"], saved["skipped"]) == ("completed", 3, 1, 1)
+    asyncio.run(main())
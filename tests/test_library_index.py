@@ -0,0 +1,75 @@
+import os
+import pytest
+from config import settings
+from library_index import LibraryIndex, audio_hash
+
+AUDIO = b"\xff\xfb" + b"frames" * 100
+
+def id3v2(payload: bytes) -> bytes:
+    size = len(payload)
+    synchsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + synchsafe + payload
+
+def id3v1(title: bytes) -> bytes:
+    return (b"TAG" + title).ljust(128, b"\0")
+
+def write(path, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DEDUP_MODE", "hardlink")
+    return LibraryIndex(str(tmp_path))
+
+def test_audio_hash_ignores_tags(tmp_path):
+    plain = tmp_path / "plain.mp3"
+    tagged = tmp_path / "tagged.mp3"
+    write(plain, AUDIO)
+    write(tagged, id3v2(b"\0" * 64) + AUDIO + id3v1(b"Other title"))
+    assert audio_hash(str(plain)) == audio_hash(str(tagged))
+
+def test_audio_hash_differs_for_different_audio(tmp_path):
+    write(tmp_path / "a.mp3", AUDIO)
+    write(tmp_path / "b.mp3", AUDIO + b"more")
+    assert audio_hash(str(tmp_path / "a.mp3")) != audio_hash(str(tmp_path / "b.mp3"))
+
+def test_duplicate_is_hardlinked_to_canonical(index, tmp_path):
+    write(tmp_path / "A - Song.mp3", AUDIO)
+    index.scan()
+    write(tmp_path / "A - Song (Remastered).mp3", id3v2(b"\0" * 10) + AUDIO)
+    index.scan()
+    assert os.path.samefile(tmp_path / "A - Song.mp3", tmp_path / "A - Song (Remastered).mp3")
+    assert index.status()["duplicates_resolved"] == 1
+
+def test_rejected_duplicate_resolves_to_canonical(index, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DEDUP_MODE", "reject")
+    write(tmp_path / "A - Song.mp3", AUDIO)
+    index.scan()
+    write(tmp_path / "A - Other.mp3", AUDIO)
+    index.scan()
+    assert os.readlink(tmp_path / "A - Other.mp3") == "A - Song.mp3"
+    assert index.files["A - Other.mp3"]["alias"] == "A - Song.mp3"
+    # The next sync sees the file and skips it, and rescans leave it alone
+    index.scan()
+    assert os.path.islink(tmp_path / "A - Other.mp3")
+    assert index.status()["duplicates_resolved"] == 1
+
+def test_deleted_canonical_is_forgotten(index, tmp_path):
+    write(tmp_path / "A - Song.mp3", AUDIO)
+    index.scan()
+    os.remove(tmp_path / "A - Song.mp3")
+    write(tmp_path / "A - Song 2.mp3", AUDIO)
+    index.scan()
+    assert list(index.files) == ["A - Song 2.mp3"]
+    assert index.status()["duplicates_resolved"] == 0
+
+def test_metadata_match_records_canonical_hash(index, tmp_path, monkeypatch):
+    tags = {"artist": "A", "title": "Song", "album": ""}
+    monkeypatch.setattr("library_index.read_tags", lambda path: tags)
+    write(tmp_path / "A - Song.mp3", AUDIO)
+    index.scan()
+    write(tmp_path / "A - Song (Remastered).mp3", AUDIO + b"remaster")
+    index.scan()
+    assert index.files["A - Song (Remastered).mp3"]["hash"] == index.files["A - Song.mp3"]["hash"]
+    assert audio_hash(str(tmp_path / "A - Song (Remastered).mp3")) == index.files["A - Song.mp3"]["hash"]
@@ -0,0 +1,38 @@
+from progress import JobProgress, ProgressTracker
+from config import settings
+
+def test_eta_uses_remaining_tracks_and_rate():
+    job = JobProgress(1, "url")
+    job.set_total(10)
+    assert job.eta() is None
+    job.complete("downloaded", "A - One")
+    job.avg_interval = 2.0
+    job.complete("skipped")
+    job.avg_interval = 2.0
+    assert job.rate() == 0.5
+    assert job.eta() == 16
+
+def test_rate_is_smoothed():
+    job = JobProgress(1, "url")
+    job.set_total(3)
+    job.complete("downloaded")
+    job.avg_interval = 1.0
+    job.last_completion -= 11.0
+    job.complete("downloaded")
+    assert 1.0 < job.avg_interval < 11.0
+
+def test_finished_job_has_no_eta():
+    job = JobProgress(1, "url")
+    job.set_total(5)
+    job.complete("downloaded")
+    job.finish()
+    assert job.eta() is None
+    assert job.to_dict()["phase"] == "done"
+
+def test_tracker_keeps_limited_finished_jobs(monkeypatch):
+    monkeypatch.setattr(settings, "PROGRESS_JOBS_KEPT", 1)
+    tracker = ProgressTracker()
+    for _ in range(3):
+        tracker.start("url").finish()
+    tracker.start("url")
+    assert len(tracker.jobs) == 2
@@ -0,0 +1,66 @@
+import asyncio
+import time
+import pytest
+from config import settings
+from rate_governor import RateGovernor, is_rate_limited
+
+@pytest.mark.parametrize("line", [
+    "ERROR: [youtube] abc: HTTP Error 429: Too Many Requests",
+    "WARNING:spotipy.client:HTTP Error for GET returned 429 due to Too many requests",
+    "ERROR: [youtube] abc: Sign in to confirm you're not a bot",
+])
+def test_throttling_log_lines_match(line):
+    assert is_rate_limited(line)
+
+@pytest.mark.parametrize("line", [
+    "Found 429 songs in Mix (Playlist)",
+    'Downloaded "Band - Rate Limit": https://music.youtube.com/watch?v=1',
+    "Skipping Band - Too Many Requests (file already exists)",
+    "ERROR: [youtube] abc: HTTP Error 403: Forbidden",
+    "ERROR: Failed to download Band - 429",
+])
+def test_other_lines_do_not_match(line):
+    assert not is_rate_limited(line)
+
+@pytest.fixture
+def governor(monkeypatch):
+    monkeypatch.setattr(settings, "GOVERNOR_RATE", 1.0)
+    monkeypatch.setattr(settings, "GOVERNOR_BURST", 2)
+    monkeypatch.setattr(settings, "SPOTDL_THREADS", 4)
+    monkeypatch.setattr(settings, "GOVERNOR_COOLDOWN", 10)
+    monkeypatch.setattr(settings, "GOVERNOR_MAX_COOLDOWN", 15)
+    return RateGovernor()
+
+def test_backoff_halves_rate_and_threads(governor):
+    assert governor.report_rate_limit()
+    assert governor.factor == 0.5
+    assert governor.threads() == 2
+    assert governor.status()["paused_for"] > 9
+
+def test_repeat_reports_while_paused_are_ignored(governor):
+    assert governor.report_rate_limit()
+    assert not governor.report_rate_limit()
+    assert governor.rate_limit_hits == 1
+    assert governor.factor == 0.5
+
+def test_cooldown_doubles_up_to_max(governor):
+    governor.report_rate_limit()
+    governor.paused_until = 0
+    governor.report_rate_limit()
+    assert governor.cooldown() == 15
+    assert governor.factor == 0.25
+
+def test_recovers_after_quiet_cooldown(governor):
+    governor.report_rate_limit()
+    governor.paused_until = 0
+    governor.last_limited = time.monotonic() - 100
+    governor.refill()
+    assert governor.factor == pytest.approx(0.6)
+
+def test_burst_is_available_immediately(governor):
+    async def acquire_burst():
+        start = time.monotonic()
+        await governor.acquire()
+        await governor.acquire()
+        return time.monotonic() - start
+    assert asyncio.run(acquire_burst()) < 0.5
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import stat
+import pytest
+from spotdl_runner import run_spotdl
+from config import settings
+from progress import tracker
+from storage import JobDeferred
+from rate_governor import governor, RateLimited
+
+# Several events in one write, as spotdl produces with --threads
+OUTPUT = (
+    "Found 4 songs in Mix (Playlist)\n"
+    'Downloaded "A - One": https://music.youtube.com/watch?v=1\n'
+    'Downloaded "B - Two": https://music.youtube.com/watch?v=2\n'
+    "Skipping C - Three (file already exists) (duplicate)\n"
+    "LookupError: No results found for song: D - Four\n"
+)
+
+class FakeManager:
+    def __init__(self):
+        self.messages = []
+
+    async def broadcast(self, message):
+        self.messages.append(message)
+
+    async def broadcast_json(self, data):
+        self.messages.append(data)
+
+class FakeState:
+    progress = {}
+
+@pytest.fixture(autouse=True)
+def fast_governor(monkeypatch):
+    # Don't wait on the shared token bucket between tests
+    monkeypatch.setattr(settings, "GOVERNOR_RATE", 1000)
+
+def fake_spotdl(tmp_path, monkeypatch, output=OUTPUT):
+    script = tmp_path / "spotdl"
+    script.write_text("#!/bin/sh\nprintf '%s' '" + output.replace("'", "'\\''") + "'\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(tmp_path) + os.pathsep + os.environ["PATH"])
+
+def test_every_line_in_a_chunk_is_counted(tmp_path, monkeypatch):
+    fake_spotdl(tmp_path, monkeypatch)
+    job = tracker.start("https://open.spotify.com/playlist/x")
+    songs = asyncio.run(run_spotdl("url", FakeManager(), FakeState(), job=job))
+    assert songs == ["A - One", "B - Two", "C - Three"]
+    progress = job.to_dict()
+    assert (progress["total"], progress["current"], progress["skipped"], progress["failed"]) == (4, 2, 1, 1)
+    assert job.downloaded_tracks == ["A - One", "B - Two"]
+
+def test_failed_space_check_stops_the_run(tmp_path, monkeypatch):
+    fake_spotdl(tmp_path, monkeypatch)
+    job = tracker.start("https://open.spotify.com/playlist/x")
+
+    def check_space():
+        raise JobDeferred("disk full")
+
+    with pytest.raises(JobDeferred):
+        asyncio.run(run_spotdl("url", FakeManager(), FakeState(), job=job, check_space=check_space))
+    assert job.downloaded_tracks == ["A - One"]
+
+def test_retry_does_not_recount_earlier_downloads(tmp_path, monkeypatch):
+    fake_spotdl(tmp_path, monkeypatch)
+    job = tracker.start("https://open.spotify.com/playlist/x")
+    job.complete("downloaded", "C - Three")
+    asyncio.run(run_spotdl("url", FakeManager(), FakeState(), job=job))
+    assert job.to_dict()["skipped"] == 0
+
+def test_rate_limit_stops_the_run_for_a_restart(tmp_path, monkeypatch):
+    fake_spotdl(tmp_path, monkeypatch, OUTPUT.replace("Skipping", "WARNING: HTTP Error 429: Too Many Requests\nSkipping"))
+    monkeypatch.setattr(governor, "report_rate_limit", lambda: True)
+    job = tracker.start("https://open.spotify.com/playlist/x")
+    with pytest.raises(RateLimited):
+        asyncio.run(run_spotdl("url", FakeManager(), FakeState(), job=job))
+    assert job.downloaded_tracks == ["A - One", "B - Two"]
+    assert job.skipped == 0
@@ -0,0 +1,72 @@
+import os
+import time
+import pytest
+from config import settings
+from storage import StorageGuard, JobDeferred, QuotaExceeded, INDEX_TEMP_SUFFIX
+
+@pytest.fixture
+def guard(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "MIN_FREE_MB", 0)
+    monkeypatch.setattr(settings, "PLAYLIST_QUOTA_MB", 0)
+    return StorageGuard(str(tmp_path))
+
+def write_mp3(guard, name, size):
+    with open(os.path.join(guard.root, name + ".mp3"), "wb") as f:
+        f.write(b"\0" * size)
+
+def test_estimate_uses_bitrate_and_track_length(guard, monkeypatch):
+    monkeypatch.setattr(settings, "BITRATE", "320k")
+    monkeypatch.setattr(settings, "AVG_TRACK_SECONDS", 100)
+    assert guard.estimate_job_bytes(2) == 2 * 40000 * 100
+
+def test_quota_overrun_is_not_deferred(guard, monkeypatch):
+    monkeypatch.setattr(settings, "PLAYLIST_QUOTA_MB", 1)
+    guard.usage["p"] = {"bytes": 2 * 1024 * 1024, "tracks": 0}
+    with pytest.raises(QuotaExceeded):
+        guard.admit(0, "p")
+
+def test_free_space_shortage_is_deferred(guard, monkeypatch):
+    monkeypatch.setattr(settings, "MIN_FREE_MB", guard.free_bytes() // 1048576 + 1)
+    with pytest.raises(JobDeferred):
+        guard.admit(1)
+
+def test_resync_only_estimates_new_tracks(guard, monkeypatch):
+    monkeypatch.setattr(settings, "PLAYLIST_QUOTA_MB", 1)
+    monkeypatch.setattr(settings, "AVG_TRACK_SECONDS", 1)
+    guard.usage["p"] = {"bytes": 0, "tracks": 50}
+    assert guard.new_tracks(52, "p") == 2
+    guard.admit(52, "p")
+
+def test_record_usage_counts_only_downloaded_files(guard):
+    write_mp3(guard, "A - New", 100)
+    write_mp3(guard, "B - Old", 1000)
+    guard.record_usage("p", ["A - New"], 2)
+    guard.record_usage("p", [], 2)
+    assert guard.usage["p"] == {"bytes": 100, "tracks": 2}
+
+def test_old_ledger_format_is_migrated(guard):
+    with open(os.path.join(guard.root, ".quota.json"), "w") as f:
+        f.write('{"p": 123}')
+    guard.load_usage()
+    assert guard.usage["p"] == {"bytes": 123, "tracks": 0}
+
+def test_sweep_spares_fresh_index_temp_files(guard, monkeypatch):
+    monkeypatch.setattr(settings, "PARTIAL_MAX_AGE", 3600)
+    for name in ("a.mp3.part", "b.mp3" + INDEX_TEMP_SUFFIX, "c.mp3" + INDEX_TEMP_SUFFIX):
+        open(os.path.join(guard.root, name), "w").close()
+    old = time.time() - 7200
+    os.utime(os.path.join(guard.root, "c.mp3" + INDEX_TEMP_SUFFIX), (old, old))
+    assert guard.sweep(0) == 2
+    assert os.listdir(guard.root) == ["b.mp3" + INDEX_TEMP_SUFFIX]
+
+def test_check_quota_ignores_free_space(guard, monkeypatch):
+    monkeypatch.setattr(settings, "PLAYLIST_QUOTA_MB", 1)
+    monkeypatch.setattr(settings, "MIN_FREE_MB", guard.free_bytes() // 1048576 + 1)
+    monkeypatch.setattr(settings, "AVG_TRACK_SECONDS", 1)
+    guard.check_quota(1, "p")
+    with pytest.raises(QuotaExceeded):
+        guard.check_quota(1000, "p")
+
+def test_missing_tracks_counts_files_not_on_disk(guard):
+    write_mp3(guard, "A - One", 10)
+    assert guard.missing_tracks(["A - One", "B - Two", "C - Three"]) == 2